@@ -1,22 +1,52 @@
-from flask import Flask, render_template, request, jsonify
+from flask import Flask, render_template, request, jsonify, Response
+from flask.json.provider import JSONProvider
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import select, update, func, bindparam
 from sqlalchemy.exc import OperationalError, IntegrityError
-import time
+from typing import Annotated, Optional
+import redis
+import orjson
+import msgspec
+import hashlib
 import sys
-from config import SQLALCHEMY_DATABASE_URI, SECRET_KEY, DEBUG
+from config import SQLALCHEMY_DATABASE_URI, SQLALCHEMY_ENGINE_OPTIONS, SECRET_KEY, DEBUG, REDIS_HOST, REDIS_PORT, REDIS_DB, REDIS_SOCKET_TIMEOUT, REDIS_CONNECT_TIMEOUT, CACHE_TTL
+
+# 使用 orjson 序列化 JSON 响应
+class ORJSONProvider(JSONProvider):
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj).decode()
+    
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
 
 app = Flask(__name__)
+app.json = ORJSONProvider(app)
 app.config['SECRET_KEY'] = SECRET_KEY
 app.config['DEBUG'] = DEBUG
 app.config['SQLALCHEMY_DATABASE_URI'] = SQLALCHEMY_DATABASE_URI
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = SQLALCHEMY_ENGINE_OPTIONS
 
 db = SQLAlchemy(app)
+cache = redis.Redis(
+    host=REDIS_HOST,
+    port=REDIS_PORT,
+    db=REDIS_DB,
+    socket_timeout=REDIS_SOCKET_TIMEOUT,
+    socket_connect_timeout=REDIS_CONNECT_TIMEOUT,
+    decode_responses=True
+)
+
+# 开发模式下关系属性禁止隐式懒加载，意外的 N+1 查询会直接抛出异常
+RELATIONSHIP_LAZY = 'raise' if DEBUG else 'select'
+
+# 主键及外键列使用二进制排序规则，按字节比较以减少索引查找和连接时的开销
+KEY_COLLATION = 'utf8mb4_bin'
 
 # 数据模型
 class Drug(db.Model):
     __tablename__ = 'drugs'
-    drug_name = db.Column(db.String(100), primary_key=True)
+    drug_name = db.Column(db.String(100, collation=KEY_COLLATION), primary_key=True)
     price = db.Column(db.Float)
     stock = db.Column(db.Integer)
     
@@ -29,7 +59,7 @@ class Drug(db.Model):
 
 class Doctor(db.Model):
     __tablename__ = 'doctors'
-    doctor_id = db.Column(db.String(100), primary_key=True)
+    doctor_id = db.Column(db.String(100, collation=KEY_COLLATION), primary_key=True)
     doctor_name = db.Column(db.String(100))
     
     def to_dict(self):
@@ -40,11 +70,11 @@ class Doctor(db.Model):
 
 class Prescription(db.Model):
     __tablename__ = 'prescriptions'
-    prescription_id = db.Column(db.String(100), primary_key=True)
-    doctor_id = db.Column(db.String(100), db.ForeignKey('doctors.doctor_id'))
+    prescription_id = db.Column(db.String(100, collation=KEY_COLLATION), primary_key=True)
+    doctor_id = db.Column(db.String(100, collation=KEY_COLLATION), db.ForeignKey('doctors.doctor_id'), index=True)
     total_fee = db.Column(db.Float, default=0)
     
-    doctor = db.relationship('Doctor', backref=db.backref('prescriptions', lazy=True))
+    doctor = db.relationship('Doctor', lazy=RELATIONSHIP_LAZY, backref=db.backref('prescriptions', lazy=RELATIONSHIP_LAZY))
     
     def to_dict(self):
         return {
@@ -56,13 +86,13 @@ class Prescription(db.Model):
 class PrescriptionDetail(db.Model):
     __tablename__ = 'prescription_details'
     id = db.Column(db.Integer, primary_key=True)
-    prescription_id = db.Column(db.String(100), db.ForeignKey('prescriptions.prescription_id'))
-    drug_name = db.Column(db.String(100), db.ForeignKey('drugs.drug_name'))
+    prescription_id = db.Column(db.String(100, collation=KEY_COLLATION), db.ForeignKey('prescriptions.prescription_id'), index=True)
+    drug_name = db.Column(db.String(100, collation=KEY_COLLATION), db.ForeignKey('drugs.drug_name'), index=True)
     quantity = db.Column(db.Integer)
     price = db.Column(db.Float)
     
-    prescription = db.relationship('Prescription', backref=db.backref('details', lazy=True))
-    drug = db.relationship('Drug', backref=db.backref('prescription_details', lazy=True))
+    prescription = db.relationship('Prescription', lazy=RELATIONSHIP_LAZY, backref=db.backref('details', lazy=RELATIONSHIP_LAZY))
+    drug = db.relationship('Drug', lazy=RELATIONSHIP_LAZY, backref=db.backref('prescription_details', lazy=RELATIONSHIP_LAZY))
     
     def to_dict(self):
         return {
@@ -73,21 +103,89 @@ class PrescriptionDetail(db.Model):
             'price': self.price
         }
 
+# 列表查询语句在模块级构造一次，每次请求直接复用并命中编译缓存
+DRUGS_SELECT = select(Drug.drug_name, Drug.price, Drug.stock)
+DOCTORS_SELECT = select(Doctor.doctor_id, Doctor.doctor_name)
+PRESCRIPTIONS_SELECT = select(Prescription.prescription_id, Prescription.doctor_id, Prescription.total_fee)
+PRESCRIPTION_DETAILS_SELECT = select(PrescriptionDetail).where(
+    PrescriptionDetail.prescription_id == bindparam('prescription_id')
+)
+
+# 请求体结构，解码时由 msgspec 完成类型校验
+NonEmptyStr = Annotated[str, msgspec.Meta(min_length=1)]
+
+class DrugIn(msgspec.Struct):
+    drug_name: NonEmptyStr
+    price: float
+    stock: int
+
+class DrugUpdate(msgspec.Struct):
+    price: Optional[float] = None
+    stock: Optional[int] = None
+
+class DoctorIn(msgspec.Struct):
+    doctor_id: NonEmptyStr
+    doctor_name: str
+
+class DoctorUpdate(msgspec.Struct):
+    doctor_name: Optional[str] = None
+
+class PrescriptionIn(msgspec.Struct):
+    prescription_id: str = ''
+    doctor_id: str = ''
+
+class PrescriptionDetailIn(msgspec.Struct):
+    drug_name: str = ''
+    quantity: int = 0
+
 # 带重试机制的数据库操作函数
-def execute_with_retry(func, max_retries=3, delay=2):
+# 连接池的 pool_pre_ping 已在取出连接时剔除失效连接，这里只兜底执行过程中断开的情况
+def execute_with_retry(func, max_retries=2):
     for attempt in range(max_retries):
         try:
             return func()
         except OperationalError as e:
             if "Lost connection to MySQL server" in str(e) and attempt < max_retries - 1:
                 print(f"数据库连接丢失，尝试重新连接 ({attempt + 1}/{max_retries})...")
-                time.sleep(delay)
+                db.session.rollback()
                 continue
             else:
                 raise e
         except Exception as e:
             raise e
 
+# Redis 缓存读写，Redis 不可用时直接回退到数据库
+def cached_response(key):
+    try:
+        value = cache.get(key)
+    except redis.RedisError as e:
+        print(f"读取缓存失败: {e}")
+        return None
+    if value:
+        return Response(value, mimetype='application/json')
+    return None
+
+def cache_and_respond(key, payload):
+    value = orjson.dumps(payload)
+    try:
+        cache.setex(key, CACHE_TTL, value)
+    except redis.RedisError as e:
+        print(f"写入缓存失败: {e}")
+    return Response(value, mimetype='application/json')
+
+def invalidate_cache(*keys):
+    try:
+        cache.delete(*keys)
+    except redis.RedisError as e:
+        print(f"清除缓存失败: {e}")
+
+# 解码并校验请求体，失败时返回 (None, 错误响应)
+def parse_body(schema):
+    try:
+        return msgspec.json.decode(request.get_data(), type=schema), None
+    except msgspec.DecodeError as e:
+        return None, (jsonify({'error': f'请求数据格式错误: {e}'}), 400)
+
 # 创建数据库表
 @app.before_first_request
 def create_tables():
@@ -108,32 +206,48 @@ def internal_error(error):
     db.session.rollback()
     return jsonify({'error': '服务器内部错误'}), 500
 
-# 前端页面
+# 前端页面，启动时渲染一次，之后直接返回缓存的内容并支持 ETag 协商缓存
+with app.app_context():
+    INDEX_BYTES = render_template('index.html').encode()
+INDEX_ETAG = hashlib.md5(INDEX_BYTES).hexdigest()
+
 @app.route('/')
 def index():
-    return render_template('index.html')
+    response = Response(INDEX_BYTES, mimetype='text/html')
+    response.set_etag(INDEX_ETAG)
+    response.cache_control.public = True
+    response.cache_control.max_age = 3600
+    return response.make_conditional(request)
 
 # API路由 - 药品管理
 @app.route('/api/drugs', methods=['GET'])
 def get_drugs():
+    cached = cached_response('drugs:all')
+    if cached:
+        return cached
+    
     def query_drugs():
-        drugs = Drug.query.all()
-        return jsonify([drug.to_dict() for drug in drugs])
+        # 只读列表直接返回行数据，不构造 ORM 对象
+        rows = db.session.execute(DRUGS_SELECT).all()
+        return cache_and_respond('drugs:all', [row._asdict() for row in rows])
     
     return execute_with_retry(query_drugs)
 
 @app.route('/api/drugs', methods=['POST'])
 def add_drug():
-    data = request.get_json()
+    data, error = parse_body(DrugIn)
+    if error:
+        return error
     
     def insert_drug():
         drug = Drug(
-            drug_name=data['drug_name'],
-            price=data['price'],
-            stock=data['stock']
+            drug_name=data.drug_name,
+            price=data.price,
+            stock=data.stock
         )
         db.session.add(drug)
         db.session.commit()
+        invalidate_cache('drugs:all', f"drug:{drug.drug_name}")
         return jsonify({'message': '药品添加成功', 'drug': drug.to_dict()})
     
     try:
@@ -145,29 +259,37 @@ def add_drug():
 
 @app.route('/api/drugs/<drug_name>', methods=['GET'])
 def get_drug(drug_name):
+    key = f'drug:{drug_name}'
+    cached = cached_response(key)
+    if cached:
+        return cached
+    
     def query_drug():
-        drug = Drug.query.filter_by(drug_name=drug_name).first()
+        drug = db.session.get(Drug, drug_name)
         if drug:
-            return jsonify(drug.to_dict())
+            return cache_and_respond(key, drug.to_dict())
         return jsonify({'error': '药品不存在'}), 404
     
     return execute_with_retry(query_drug)
 
 @app.route('/api/drugs/<drug_name>', methods=['PUT'])
 def update_drug(drug_name):
-    data = request.get_json()
+    data, error = parse_body(DrugUpdate)
+    if error:
+        return error
     
     def update():
-        drug = Drug.query.filter_by(drug_name=drug_name).first()
+        drug = db.session.get(Drug, drug_name)
         if not drug:
             return jsonify({'error': '药品不存在'}), 404
         
-        if 'price' in data:
-            drug.price = data['price']
-        if 'stock' in data:
-            drug.stock = data['stock']
+        if data.price is not None:
+            drug.price = data.price
+        if data.stock is not None:
+            drug.stock = data.stock
         
         db.session.commit()
+        invalidate_cache('drugs:all', f'drug:{drug_name}')
         return jsonify({'message': '药品更新成功', 'drug': drug.to_dict()})
     
     return execute_with_retry(update)
@@ -175,20 +297,21 @@ def update_drug(drug_name):
 @app.route('/api/drugs/<drug_name>', methods=['DELETE'])
 def delete_drug(drug_name):
     def delete():
-        drug = Drug.query.filter_by(drug_name=drug_name).first()
+        drug = db.session.get(Drug, drug_name)
         if not drug:
             return jsonify({'error': '药品不存在'}), 404
         
         # 检查是否有处方明细关联到此药品
-        details = PrescriptionDetail.query.filter_by(drug_name=drug_name).all()
-        if details:
+        detail_count = db.session.query(func.count(PrescriptionDetail.id)).filter_by(drug_name=drug_name).scalar()
+        if detail_count > 0:
             return jsonify({
                 'error': '无法删除药品，存在关联的处方明细',
-                'detail_count': len(details)
+                'detail_count': detail_count
             }), 400
         
         db.session.delete(drug)
         db.session.commit()
+        invalidate_cache('drugs:all', f'drug:{drug_name}')
         return jsonify({'message': '药品删除成功'})
     
     return execute_with_retry(delete)
@@ -196,23 +319,30 @@ def delete_drug(drug_name):
 # API路由 - 医生管理
 @app.route('/api/doctors', methods=['GET'])
 def get_doctors():
+    cached = cached_response('doctors:all')
+    if cached:
+        return cached
+    
     def query_doctors():
-        doctors = Doctor.query.all()
-        return jsonify([doctor.to_dict() for doctor in doctors])
+        rows = db.session.execute(DOCTORS_SELECT).all()
+        return cache_and_respond('doctors:all', [row._asdict() for row in rows])
     
     return execute_with_retry(query_doctors)
 
 @app.route('/api/doctors', methods=['POST'])
 def add_doctor():
-    data = request.get_json()
+    data, error = parse_body(DoctorIn)
+    if error:
+        return error
     
     def insert_doctor():
         doctor = Doctor(
-            doctor_id=data['doctor_id'],
-            doctor_name=data['doctor_name']
+            doctor_id=data.doctor_id,
+            doctor_name=data.doctor_name
         )
         db.session.add(doctor)
         db.session.commit()
+        invalidate_cache('doctors:all', f"doctor:{doctor.doctor_id}")
         return jsonify({'message': '医生添加成功', 'doctor': doctor.to_dict()})
     
     try:
@@ -224,27 +354,35 @@ def add_doctor():
 
 @app.route('/api/doctors/<doctor_id>', methods=['GET'])
 def get_doctor(doctor_id):
+    key = f'doctor:{doctor_id}'
+    cached = cached_response(key)
+    if cached:
+        return cached
+    
     def query_doctor():
-        doctor = Doctor.query.filter_by(doctor_id=doctor_id).first()
+        doctor = db.session.get(Doctor, doctor_id)
         if doctor:
-            return jsonify(doctor.to_dict())
+            return cache_and_respond(key, doctor.to_dict())
         return jsonify({'error': '医生不存在'}), 404
     
     return execute_with_retry(query_doctor)
 
 @app.route('/api/doctors/<doctor_id>', methods=['PUT'])
 def update_doctor(doctor_id):
-    data = request.get_json()
+    data, error = parse_body(DoctorUpdate)
+    if error:
+        return error
     
     def update():
-        doctor = Doctor.query.filter_by(doctor_id=doctor_id).first()
+        doctor = db.session.get(Doctor, doctor_id)
         if not doctor:
             return jsonify({'error': '医生不存在'}), 404
         
-        if 'doctor_name' in data:
-            doctor.doctor_name = data['doctor_name']
+        if data.doctor_name is not None:
+            doctor.doctor_name = data.doctor_name
         
         db.session.commit()
+        invalidate_cache('doctors:all', f'doctor:{doctor_id}')
         return jsonify({'message': '医生更新成功', 'doctor': doctor.to_dict()})
     
     return execute_with_retry(update)
@@ -252,20 +390,21 @@ def update_doctor(doctor_id):
 @app.route('/api/doctors/<doctor_id>', methods=['DELETE'])
 def delete_doctor(doctor_id):
     def delete():
-        doctor = Doctor.query.filter_by(doctor_id=doctor_id).first()
+        doctor = db.session.get(Doctor, doctor_id)
         if not doctor:
             return jsonify({'error': '医生不存在'}), 404
         
         # 检查是否有处方关联到此医生
-        prescriptions = Prescription.query.filter_by(doctor_id=doctor_id).all()
-        if prescriptions:
+        prescription_count = db.session.query(func.count(Prescription.prescription_id)).filter_by(doctor_id=doctor_id).scalar()
+        if prescription_count > 0:
             return jsonify({
                 'error': '无法删除医生，存在关联的处方',
-                'prescription_count': len(prescriptions)
+                'prescription_count': prescription_count
             }), 400
         
         db.session.delete(doctor)
         db.session.commit()
+        invalidate_cache('doctors:all', f'doctor:{doctor_id}')
         return jsonify({'message': '医生删除成功'})
     
     return execute_with_retry(delete)
@@ -273,53 +412,64 @@ def delete_doctor(doctor_id):
 # API路由 - 处方管理
 @app.route('/api/prescriptions', methods=['GET'])
 def get_prescriptions():
+    cached = cached_response('prescriptions:all')
+    if cached:
+        return cached
+    
     def query_prescriptions():
-        prescriptions = Prescription.query.all()
-        return jsonify([prescription.to_dict() for prescription in prescriptions])
+        rows = db.session.execute(PRESCRIPTIONS_SELECT).all()
+        return cache_and_respond('prescriptions:all', [row._asdict() for row in rows])
     
     return execute_with_retry(query_prescriptions)
 
 @app.route('/api/prescriptions', methods=['POST'])
 def add_prescription():
-    data = request.get_json()
+    data, error = parse_body(PrescriptionIn)
+    if error:
+        return error
     
     # 验证必需字段
-    if not data.get('prescription_id'):
+    if not data.prescription_id:
         return jsonify({'error': '处方ID不能为空'}), 400
-    if not data.get('doctor_id'):
+    if not data.doctor_id:
         return jsonify({'error': '医生ID不能为空'}), 400
     
+    # 直接插入，由数据库的主键和外键约束判断处方是否重复、医生是否存在
     def insert_prescription():
-        # 检查处方是否已存在
-        existing_prescription = Prescription.query.filter_by(prescription_id=data['prescription_id']).first()
-        if existing_prescription:
-            return jsonify({'error': '处方ID已存在'}), 400
-        
-        # 检查医生是否存在
-        doctor = Doctor.query.filter_by(doctor_id=data['doctor_id']).first()
-        if not doctor:
-            return jsonify({'error': '医生不存在'}), 400
-        
         prescription = Prescription(
-            prescription_id=data['prescription_id'],
-            doctor_id=data['doctor_id']
+            prescription_id=data.prescription_id,
+            doctor_id=data.doctor_id
         )
         db.session.add(prescription)
         db.session.commit()
+        invalidate_cache('prescriptions:all', f"prescription:{prescription.prescription_id}")
         return jsonify({'message': '处方创建成功', 'prescription': prescription.to_dict()})
     
     try:
         return execute_with_retry(insert_prescription)
+    except IntegrityError as e:
+        db.session.rollback()
+        # MySQL 错误码 1062 为主键重复，1452 为外键约束失败
+        if e.orig.args[0] == 1062:
+            return jsonify({'error': '处方ID已存在'}), 400
+        if e.orig.args[0] == 1452:
+            return jsonify({'error': '医生不存在'}), 400
+        return jsonify({'error': f'创建处方时发生错误: {str(e)}'}), 500
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': f'创建处方时发生错误: {str(e)}'}), 500
 
 @app.route('/api/prescriptions/<prescription_id>', methods=['GET'])
 def get_prescription(prescription_id):
+    key = f'prescription:{prescription_id}'
+    cached = cached_response(key)
+    if cached:
+        return cached
+    
     def query_prescription():
-        prescription = Prescription.query.filter_by(prescription_id=prescription_id).first()
+        prescription = db.session.get(Prescription, prescription_id)
         if prescription:
-            return jsonify(prescription.to_dict())
+            return cache_and_respond(key, prescription.to_dict())
         return jsonify({'error': '处方不存在'}), 404
     
     return execute_with_retry(query_prescription)
@@ -327,65 +477,78 @@ def get_prescription(prescription_id):
 @app.route('/api/prescriptions/<prescription_id>', methods=['DELETE'])
 def delete_prescription(prescription_id):
     def delete():
-        prescription = Prescription.query.filter_by(prescription_id=prescription_id).first()
+        prescription = db.session.get(Prescription, prescription_id)
         if not prescription:
             return jsonify({'error': '处方不存在'}), 404
         
-        # 先删除相关的处方明细
-        PrescriptionDetail.query.filter_by(prescription_id=prescription_id).delete()
-        # 再删除处方
+        # 先用单条 DELETE 批量删除相关的处方明细，不同步会话中的对象
+        PrescriptionDetail.query.filter_by(prescription_id=prescription_id).delete(synchronize_session=False)
+        # 再删除处方，与明细在同一事务中提交
         db.session.delete(prescription)
         db.session.commit()
+        invalidate_cache('prescriptions:all', f'prescription:{prescription_id}', f'prescription_details:{prescription_id}')
         return jsonify({'message': '处方删除成功'})
     
     return execute_with_retry(delete)
 
 @app.route('/api/prescriptions/<prescription_id>/details', methods=['GET'])
 def get_prescription_details(prescription_id):
+    key = f'prescription_details:{prescription_id}'
+    cached = cached_response(key)
+    if cached:
+        return cached
+    
     def query_details():
-        details = PrescriptionDetail.query.filter_by(prescription_id=prescription_id).all()
-        return jsonify([detail.to_dict() for detail in details])
+        details = db.session.execute(
+            PRESCRIPTION_DETAILS_SELECT, {'prescription_id': prescription_id}
+        ).scalars().all()
+        return cache_and_respond(key, [detail.to_dict() for detail in details])
     
     return execute_with_retry(query_details)
 
 @app.route('/api/prescriptions/<prescription_id>/details', methods=['POST'])
 def add_prescription_detail(prescription_id):
-    data = request.get_json()
+    data, error = parse_body(PrescriptionDetailIn)
+    if error:
+        return error
     
     # 验证必需字段
-    if not data.get('drug_name'):
+    if not data.drug_name:
         return jsonify({'error': '药品名称不能为空'}), 400
-    if not data.get('quantity') or data.get('quantity') <= 0:
+    if data.quantity <= 0:
         return jsonify({'error': '药品数量必须大于0'}), 400
     
     def insert_detail():
         # 检查处方是否存在
-        prescription = Prescription.query.filter_by(prescription_id=prescription_id).first()
+        prescription = db.session.get(Prescription, prescription_id)
         if not prescription:
             return jsonify({'error': '处方不存在'}), 400
         
-        # 检查药品是否存在
-        drug = Drug.query.filter_by(drug_name=data['drug_name']).first()
-        if not drug:
-            return jsonify({'error': '药品不存在'}), 400
-        
-        # 检查库存是否足够
-        if drug.stock < data['quantity']:
+        # 库存足够时原子扣减，避免并发请求读改写导致超卖
+        result = db.session.execute(
+            update(Drug)
+            .where(Drug.drug_name == data.drug_name, Drug.stock >= data.quantity)
+            .values(stock=Drug.stock - data.quantity)
+        )
+        if result.rowcount == 0:
+            drug = db.session.get(Drug, data.drug_name)
+            if not drug:
+                return jsonify({'error': '药品不存在'}), 400
             return jsonify({'error': f'药品库存不足，当前库存: {drug.stock}'}), 400
         
+        # 响应需要返回明细的单价，MySQL 不支持 RETURNING，改用 INSERT ... SELECT 仍需再查询一次，
+        # 因此在扣减库存后直接读取单价；此时该行已被 UPDATE 加锁，单价与扣减的库存一致
+        price = db.session.scalar(select(Drug.price).where(Drug.drug_name == data.drug_name))
         detail = PrescriptionDetail(
             prescription_id=prescription_id,
-            drug_name=data['drug_name'],
-            quantity=data['quantity'],
-            price=drug.price
+            drug_name=data.drug_name,
+            quantity=data.quantity,
+            price=price
         )
         
         db.session.add(detail)
-        
-        # 更新药品库存
-        drug.stock -= data['quantity']
-        
         db.session.commit()
+        invalidate_cache(f'prescription_details:{prescription_id}', 'drugs:all', f'drug:{data.drug_name}')
         return jsonify({'message': '处方明细添加成功', 'detail': detail.to_dict()})
     
     try:
@@ -397,15 +560,22 @@ def add_prescription_detail(prescription_id):
 @app.route('/api/prescriptions/<prescription_id>/calculate', methods=['POST'])
 def calculate_prescription(prescription_id):
     def calculate():
-        prescription = Prescription.query.filter_by(prescription_id=prescription_id).first()
-        if not prescription:
-            return jsonify({'error': '处方不存在'}), 404
+        # 在数据库中汇总明细金额，不加载明细对象
+        total_fee = db.session.query(
+            func.coalesce(func.sum(PrescriptionDetail.quantity * PrescriptionDetail.price), 0)
+        ).filter(PrescriptionDetail.prescription_id == prescription_id).scalar()
+        total_fee = float(total_fee)
         
-        details = PrescriptionDetail.query.filter_by(prescription_id=prescription_id).all()
-        total_fee = sum(detail.quantity * detail.price for detail in details)
+        # MySQL 方言的 rowcount 为匹配行数，为 0 说明处方不存在
+        updated = Prescription.query.filter_by(prescription_id=prescription_id).update(
+            {'total_fee': total_fee}, synchronize_session=False
+        )
+        if not updated:
+            db.session.rollback()
+            return jsonify({'error': '处方不存在'}), 404
         
-        prescription.total_fee = total_fee
         db.session.commit()
+        invalidate_cache('prescriptions:all', f'prescription:{prescription_id}')
         return jsonify({'message': '处方总费用计算成功', 'total_fee': total_fee})
     
     return execute_with_retry(calculate)
@@ -1,12 +1,35 @@
 import os
 
 SECRET_KEY = os.urandom(24)
-DEBUG = True
+DEBUG = os.environ.get('DEBUG', '0').lower() in ('1', 'true')
 DB_USERNAME = 'root'
 DB_PASSWORD = '123456'
 DB_HOST = '127.0.0.1'
 DB_PORT = '3306'
 DB_NAME = 'test'
-DB_URI = f'mysql+pymysql://{DB_USERNAME}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}?charset=utf8'
+DB_URI = f'mysql+pymysql://{DB_USERNAME}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}?charset=utf8mb4'
 SQLALCHEMY_DATABASE_URI = DB_URI
-SQLALCHEMY_TRACK_MODIFICATIONS = False
\ No newline at end of file
+SQLALCHEMY_TRACK_MODIFICATIONS = False
+# worker 进程数，每个进程各自持有一个连接池；开发服务器为单进程，gunicorn 启动时由 gunicorn.conf.py 设置
+WEB_WORKERS = int(os.environ.get('WEB_WORKERS', 1))
+# 所有进程合计的数据库连接上限，需低于 MySQL 的 max_connections（默认 151）
+DB_MAX_CONNECTIONS = int(os.environ.get('DB_MAX_CONNECTIONS', 140))
+if not 1 <= WEB_WORKERS <= DB_MAX_CONNECTIONS:
+    raise ValueError(f'WEB_WORKERS 必须在 1 到 DB_MAX_CONNECTIONS ({DB_MAX_CONNECTIONS}) 之间，当前为 {WEB_WORKERS}')
+DB_CONNECTIONS_PER_WORKER = DB_MAX_CONNECTIONS // WEB_WORKERS
+DB_POOL_SIZE = min(20, max(1, DB_CONNECTIONS_PER_WORKER // 3))
+DB_MAX_OVERFLOW = min(40, DB_CONNECTIONS_PER_WORKER - DB_POOL_SIZE)
+SQLALCHEMY_ENGINE_OPTIONS = {
+    'pool_size': DB_POOL_SIZE,
+    'max_overflow': DB_MAX_OVERFLOW,
+    'pool_timeout': 30,
+    'pool_recycle': 1800,
+    'pool_pre_ping': True,
+    'query_cache_size': 1200
+}
+REDIS_HOST = '127.0.0.1'
+REDIS_PORT = 6379
+REDIS_DB = 0
+REDIS_SOCKET_TIMEOUT = 0.5
+REDIS_CONNECT_TIMEOUT = 0.5
+CACHE_TTL = 60
\ No newline at end of file
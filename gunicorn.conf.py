@@ -0,0 +1,13 @@
+import multiprocessing
+import os
+
+# 未显式指定时按 CPU 核数启动 worker，最多 4 个；需在导入 config 之前设置
+os.environ.setdefault('WEB_WORKERS', str(min(multiprocessing.cpu_count(), 4)))
+
+from config import WEB_WORKERS
+
+# gevent 协程 worker，数据库和 Redis 等待期间不阻塞同一进程内的其他请求
+bind = '0.0.0.0:5000'
+workers = WEB_WORKERS
+worker_class = 'gevent'
+worker_connections = 500
\ No newline at end of file